@@ -1,18 +1,27 @@
 import asyncio
-import base64
+import json
 import cv2
 import numpy as np
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 
 # Import the YOLOv8 segmentation class
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from ml.iphone_yolo_segmentation import iPhoneYOLOSegmentation, list_available_cameras
+from ml.buffer_pool import FrameBufferPool, read_frame
+from ml.renditions import RENDITIONS, DEFAULT_RENDITION, RenditionEncoder
+from ml.video_encoder import H264StreamEncoder, H264_CODEC, h264_available
+from ml.detection_history import DetectionHistory
+from core.config import settings
+from utils.admission import AdmissionController
+from utils.latency import LatencyTracker
+from api.stream_connections import ConnectionManager, VIDEO_FRAMING
 
 # Create FastAPI app
 app = FastAPI(title="Camera Stream API")
@@ -26,129 +35,477 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Connection manager for WebSockets
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# Create latency tracker instance
+latency = LatencyTracker()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Limits concurrent stream subscribers, keeping slots free for the crew HMD
+admission = AdmissionController(
+    "streams", settings.STREAM_PRIORITY_LIMITS, settings.DEFAULT_PRIORITY,
+    settings.PRIORITY_TOKENS
+)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# Create connection manager instance; each subscriber gets its own sender
+manager = ConnectionManager(latency, admission)
 
-    async def broadcast(self, data: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(data)
-            except Exception:
-                # Handle disconnection or errors
-                pass
+# Priority tokens come from the handshake, never the query string, which the
+# access log records. Native clients send the X-Priority-Token header;
+# browsers, which can't set headers, offer the subprotocols
+# [STREAM_SUBPROTOCOL, PRIORITY_TOKEN_PROTOCOL + token].
+STREAM_SUBPROTOCOL = "suits-stream"
+PRIORITY_TOKEN_PROTOCOL = "priority-token."
+
+def stream_subprotocol(websocket: WebSocket) -> Optional[str]:
+    """The subprotocol to accept with, so browsers that offered one connect"""
+    return STREAM_SUBPROTOCOL if STREAM_SUBPROTOCOL in websocket.scope.get("subprotocols", []) else None
+
+def priority_token(websocket: WebSocket) -> Optional[str]:
+    """The priority token sent in the handshake, if any"""
+    token = websocket.headers.get("x-priority-token")
+    if token is not None:
+        return token
+    for protocol in websocket.scope.get("subprotocols", []):
+        if protocol.startswith(PRIORITY_TOKEN_PROTOCOL):
+            return protocol[len(PRIORITY_TOKEN_PROTOCOL):]
+    return None
 
-# Create connection manager instance
-manager = ConnectionManager()
+async def admit(websocket: WebSocket) -> Optional[str]:
+    """
+    Take a stream slot for a new client, or close it with a reason when over
+    capacity (1013 Try Again Later)
+
+    Returns:
+        The resolved priority class, or None if the client was shed
+    """
+    priority = admission.resolve(priority_token(websocket))
+    if admission.try_acquire(priority):
+        return priority
+
+    reason = f"Stream at capacity, retry after {settings.RETRY_AFTER_SECONDS}s"
+    await websocket.accept(subprotocol=stream_subprotocol(websocket))
+    await websocket.send_json({"error": reason, "retry_after": settings.RETRY_AFTER_SECONDS})
+    await websocket.close(code=1013, reason=reason)
+    return None
 
 # Camera stream settings
 CAMERA_INDEX = 1  # Default camera index for iPhone (adjust if needed)
 STREAM_FPS = 15   # Target FPS for streaming
 FRAME_WIDTH = 640  # Resize width for better performance
 FRAME_HEIGHT = 480  # Resize height for better performance
+FRAME_SLOTS = 1  # Preallocated frame buffers; capture -> encode runs one frame at a time
+HISTORY_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'detection_history')
+HISTORY_MEMORY_CHUNKS = 8  # Sealed chunks of detections kept in memory before spilling to disk
+MAX_COUNT_BUCKETS = 10000  # Upper bound on buckets in a single counts query
+MAX_QUERY_LIMIT = 1000  # Upper bound on detections returned by a region query
 
 # Initialize YOLOv8 segmentation
 segmentation = None
 
+# History of every detection, queryable by class and time; opened on startup
+history: Optional[DetectionHistory] = None
+
+@app.on_event("startup")
+async def open_history():
+    global history
+    history = DetectionHistory(HISTORY_DIR, memory_chunks=HISTORY_MEMORY_CHUNKS)
+
+@app.on_event("shutdown")
+async def close_history():
+    """Stop the capture loop, then write the detections still in memory to disk"""
+    if manager.producer is not None and not manager.producer.done():
+        manager.producer.cancel()
+        try:
+            await manager.producer
+        except asyncio.CancelledError:
+            pass
+    if history is not None:
+        await asyncio.get_running_loop().run_in_executor(None, history.close)
+
+def load_segmentation(camera_index: int) -> iPhoneYOLOSegmentation:
+    """Load the model for a camera and record its class names in the history"""
+    global segmentation
+    segmentation = iPhoneYOLOSegmentation(camera_index=camera_index)
+    history.set_class_names(segmentation.model.names)
+    return segmentation
+
 @app.get("/api/cameras")
 async def get_cameras():
     """List all available cameras"""
     cameras = list_available_cameras()
     return {"cameras": cameras}
 
+@app.get("/api/renditions")
+async def get_renditions():
+    """List the stream renditions clients can subscribe to"""
+    return {
+        "default": DEFAULT_RENDITION,
+        "renditions": [r.to_dict() for r in RENDITIONS.values()]
+    }
+
+@app.get("/api/admission")
+async def get_admission():
+    """Stream subscriber counts and shed connection counters"""
+    return admission.stats()
+
+@app.get("/api/latency")
+async def get_latency():
+    """Pipeline stage latencies and per-client glass-to-glass latency percentiles"""
+    return latency.stats()
+
+@app.get("/api/latency/{client_id}")
+async def get_client_latency(client_id: str):
+    """Latency percentiles and clock offset estimate for one client"""
+    stats = latency.client_stats(client_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No latency data for client {client_id}")
+    return stats
+
+def resolve_class(class_id: Optional[int], class_name: Optional[str]) -> Optional[int]:
+    """Class id from either an id or a model class name"""
+    if history is None:
+        raise HTTPException(status_code=503, detail="Detection history is not open")
+    if class_name is None:
+        return class_id
+    resolved = history.class_id(class_name)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail=f"Unknown class: {class_name}")
+    return resolved
+
+# History handlers are plain functions so FastAPI runs them in its threadpool;
+# scans over memory-mapped chunks must not stall the stream on the event loop
+
+@app.get("/api/detections")
+def get_detection_history_stats():
+    """Size of the detection history"""
+    if history is None:
+        raise HTTPException(status_code=503, detail="Detection history is not open")
+    return history.stats()
+
+@app.get("/api/detections/last-seen")
+def get_last_seen(class_name: Optional[str] = None, class_id: Optional[int] = None,
+                  camera: Optional[int] = None):
+    """When and where a class was last detected"""
+    class_id = resolve_class(class_id, class_name)
+    if class_id is None:
+        raise HTTPException(status_code=400, detail="class_name or class_id is required")
+    detection = history.last_seen(class_id, camera)
+    if detection is None:
+        raise HTTPException(status_code=404, detail="Class has not been seen")
+    return detection
+
+@app.get("/api/detections/counts")
+def get_detection_counts(start: float, end: Optional[float] = None, bucket: float = 60.0,
+                         class_name: Optional[str] = None, class_id: Optional[int] = None,
+                         camera: Optional[int] = None):
+    """Detections per time bucket between start and end (seconds since epoch)"""
+    end = time.time() if end is None else end
+    if bucket <= 0 or end < start:
+        raise HTTPException(status_code=400, detail="bucket must be positive and end after start")
+    if (end - start) / bucket > MAX_COUNT_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_COUNT_BUCKETS} buckets per query")
+    class_id = resolve_class(class_id, class_name)
+    return {"buckets": history.counts(start, end, bucket, class_id, camera)}
+
+@app.get("/api/detections/region")
+def get_detections_in_region(x1: float, y1: float, x2: float, y2: float,
+                             start: float = 0.0, end: Optional[float] = None,
+                             class_name: Optional[str] = None, class_id: Optional[int] = None,
+                             camera: Optional[int] = None,
+                             limit: int = Query(100, ge=1, le=MAX_QUERY_LIMIT)):
+    """Detections whose boxes intersect a frame region, newest first"""
+    if x1 > x2 or y1 > y2:
+        raise HTTPException(status_code=400, detail="Region must have x1 <= x2 and y1 <= y2")
+    end = time.time() if end is None else end
+    class_id = resolve_class(class_id, class_name)
+    return {"detections": history.query(start, end, class_id, camera, (x1, y1, x2, y2), limit)}
+
 @app.get("/api/start-camera/{camera_index}")
 async def start_camera(camera_index: int):
     """Initialize the camera with the specified index"""
-    global segmentation
     try:
-        segmentation = iPhoneYOLOSegmentation(camera_index=camera_index)
+        load_segmentation(camera_index)
         return {"status": "success", "message": f"Camera {camera_index} initialized"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-@app.websocket("/ws/camera-stream")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for streaming camera feed"""
-    global segmentation
-    
-    # Accept the WebSocket connection
-    await manager.connect(websocket)
-    
-    # Initialize camera if not already done
-    if segmentation is None:
-        try:
-            segmentation = iPhoneYOLOSegmentation(camera_index=CAMERA_INDEX)
-        except Exception as e:
-            await websocket.send_json({"error": f"Failed to initialize camera: {str(e)}"})
-            manager.disconnect(websocket)
-            return
-    
+def capture_and_process(cap, buffers):
+    """
+    Capture a frame into the slot and run segmentation on it. Runs in a worker
+    thread so the event loop keeps timestamping client acks during inference.
+
+    Returns:
+        The rendered frame (None if capture failed) and its timestamps
+    """
+    frame = read_frame(cap, buffers)
+    timestamps = {"capture": time.time()}
+    if frame is None:
+        return None, timestamps
+
+    processed_frame = segmentation.process_frame(frame, buffers=buffers)
+    timestamps["inference"] = time.time()
+    return processed_frame, timestamps
+
+async def stream_frames():
+    """
+    Shared capture loop: capture, process and encode each frame once, then
+    fan it out to every subscriber. Runs while anyone is connected.
+    """
     # Open camera
     cap = cv2.VideoCapture(segmentation.camera_index)
-    
+
     if not cap.isOpened():
-        await websocket.send_json({"error": f"Could not open camera with index {segmentation.camera_index}"})
-        manager.disconnect(websocket)
+        await manager.broadcast_json({"error": f"Could not open camera with index {segmentation.camera_index}"})
+        await manager.close_all()
         return
-    
+
     # Calculate delay to maintain target FPS
     frame_delay = 1.0 / STREAM_FPS
-    
+
+    # Preallocated frame buffers reused for every frame of the stream
+    capture_shape = (
+        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or FRAME_HEIGHT,
+        int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or FRAME_WIDTH,
+        3,
+    )
+    pool = FrameBufferPool(FRAME_WIDTH, FRAME_HEIGHT, size=FRAME_SLOTS, capture_shape=capture_shape)
+    encoder = RenditionEncoder()
+    video_encoder = None
+    # One worker: the model is not thread-safe and frames are processed in order
+    inference = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    frame_id = 0
+
     try:
-        while True:
+        while manager.has_subscribers():
             start_time = time.time()
-            
-            # Capture frame
-            ret, frame = cap.read()
-            
-            if not ret:
-                await websocket.send_json({"error": "Failed to capture frame"})
-                break
-            
-            # Resize frame for better performance
-            frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
-            
-            # Process frame with YOLOv8 segmentation
-            processed_frame = segmentation.process_frame(frame)
-            
-            # Encode frame to JPEG
-            _, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            
-            # Convert to base64 for sending over WebSocket
-            frame_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Send frame to client
-            await websocket.send_json({
-                "frame": frame_base64,
-                "timestamp": time.time()
-            })
-            
+            frame_id += 1
+            buffers = pool.acquire()
+            if buffers is None:
+                # Every slot is still in use; skip this frame rather than block
+                await asyncio.sleep(frame_delay)
+                continue
+
+            try:
+                # Capture, resize and segment the frame into the slot off the loop
+                processed_frame, timestamps = await loop.run_in_executor(
+                    inference, capture_and_process, cap, buffers
+                )
+
+                if processed_frame is None:
+                    await manager.broadcast_json({"error": "Failed to capture frame"})
+                    await manager.close_all()
+                    break
+
+                history.append(timestamps["capture"], segmentation.camera_index,
+                               segmentation.last_detections)
+
+                # Encode once per rendition that somebody is subscribed to,
+                # alongside the H.264 stream when it has subscribers
+                encodes = [encoder.encode(processed_frame, manager.wanted_renditions())]
+                joining = manager.video_pending()
+                if manager.video_connections:
+                    if video_encoder is None:
+                        video_encoder = H264StreamEncoder(FRAME_WIDTH, FRAME_HEIGHT, STREAM_FPS)
+                    if manager.video_joining():
+                        video_encoder.request_keyframe()
+                    encodes.append(video_encoder.encode(processed_frame))
+                results = await asyncio.gather(*encodes)
+                timestamps["encode"] = time.time()
+            finally:
+                pool.release(buffers)
+
+            # Hand frames to each client's sender; slow clients drop frames
+            manager.publish_frames(results[0], frame_id, timestamps)
+            if len(results) > 1 and results[1][0]:
+                manager.publish_video(*results[1], joining, frame_id, timestamps)
+
             # Calculate time to sleep to maintain target FPS
             elapsed = time.time() - start_time
             sleep_time = max(0, frame_delay - elapsed)
             await asyncio.sleep(sleep_time)
-            
+
+    except Exception as e:
+        # The shared loop is gone, so end every stream and free its slot
+        await manager.broadcast_json({"error": str(e)})
+        await manager.close_all()
+    finally:
+        # Release camera
+        inference.shutdown(wait=True)
+        cap.release()
+        encoder.shutdown()
+        if video_encoder is not None:
+            video_encoder.close()
+
+async def handle_ack(websocket: WebSocket, message: Dict[str, Any], acked: float) -> bool:
+    """
+    Record {"ack": <frame_id>, "received": <t>, "displayed": <t>} from a
+    client in the latency tracker
+
+    Returns:
+        Whether the message was an ack
+    """
+    if "ack" not in message or "received" not in message:
+        return False
+    try:
+        frame_id = int(message["ack"])
+        received = float(message["received"])
+        displayed = message.get("displayed")
+        displayed = float(displayed) if displayed is not None else None
+    except (TypeError, ValueError):
+        await websocket.send_json({"error": "Invalid ack"})
+        return True
+    latency.record_ack(manager.client_id(websocket), frame_id,
+                       received, displayed, acked)
+    return True
+
+def ensure_stream_running():
+    """Start the shared capture loop if it is not already running"""
+    if manager.producer is None or manager.producer.done():
+        manager.producer = asyncio.create_task(stream_frames())
+
+@app.websocket("/ws/camera-stream")
+async def websocket_endpoint(websocket: WebSocket, rendition: str = DEFAULT_RENDITION,
+                             client_id: Optional[str] = None):
+    """
+    WebSocket endpoint for streaming camera feed
+
+    Clients pick a rendition with the `rendition` query parameter and can
+    switch mid-stream by sending {"rendition": "<name>"}.
+
+    Every frame carries a `frame_id` and server `timestamps` (capture,
+    inference, encode, send). Clients may acknowledge frames with
+    {"ack": <frame_id>, "received": <t>, "displayed": <t>} in their own
+    clock (seconds since epoch) to feed the /api/latency statistics;
+    `client_id` names the client there.
+
+    A priority token in the handshake (see STREAM_SUBPROTOCOL) selects the
+    admission class when it matches a configured PRIORITY_TOKENS entry (e.g.
+    the crew HMD's token); other clients are admitted as DEFAULT_PRIORITY.
+    When the stream is at capacity for the class the socket is closed with
+    code 1013.
+    """
+    global segmentation
+
+    if rendition not in RENDITIONS:
+        await websocket.accept(subprotocol=stream_subprotocol(websocket))
+        await websocket.send_json({"error": f"Unknown rendition: {rendition}"})
+        await websocket.close()
+        return
+
+    priority = await admit(websocket)
+    if priority is None:
+        return
+
+    # Accept the WebSocket connection
+    await manager.connect(websocket, rendition, client_id, priority, stream_subprotocol(websocket))
+
+    # Initialize camera if not already done
+    if segmentation is None:
+        try:
+            load_segmentation(CAMERA_INDEX)
+        except Exception as e:
+            await websocket.send_json({"error": f"Failed to initialize camera: {str(e)}"})
+            manager.disconnect(websocket)
+            return
+
+    ensure_stream_running()
+
+    try:
+        # Frames are pushed by the shared loop; here we only handle control messages
+        while True:
+            message = await websocket.receive_json()
+            acked = time.time()
+            if not isinstance(message, dict):
+                continue
+
+            if await handle_ack(websocket, message, acked):
+                continue
+
+            requested = message.get("rendition")
+            if requested is None:
+                continue
+            if requested in RENDITIONS:
+                manager.set_rendition(websocket, requested)
+            else:
+                await websocket.send_json({"error": f"Unknown rendition: {requested}"})
+
     except WebSocketDisconnect:
         # Client disconnected
         manager.disconnect(websocket)
     except Exception as e:
         # Handle other exceptions
+        manager.disconnect(websocket)
         try:
             await websocket.send_json({"error": str(e)})
         except:
             pass
+
+@app.websocket("/ws/video-stream")
+async def video_stream_endpoint(websocket: WebSocket, client_id: Optional[str] = None):
+    """
+    WebSocket endpoint streaming the annotated feed as H.264
+
+    The first message is a JSON config for the client's decoder; every
+    following message is a binary frame: a 4-byte big-endian header length,
+    a JSON header ({"frame_id", "keyframe", "timestamps"}) and the Annex B
+    chunk. New clients start at a keyframe requested on join.
+
+    Clients acknowledge frames with the same JSON acks as the JPEG stream,
+    so /api/latency reports H.264 glass-to-glass latency under `client_id`.
+    Priority tokens are taken from the handshake as for the JPEG stream.
+    """
+    global segmentation
+
+    if not h264_available():
+        await websocket.accept(subprotocol=stream_subprotocol(websocket))
+        await websocket.send_json({"error": "Video streaming is not available (PyAV not installed)"})
+        await websocket.close()
+        return
+
+    priority = await admit(websocket)
+    if priority is None:
+        return
+
+    # Accept the WebSocket connection
+    await manager.connect_video(websocket, client_id, priority, stream_subprotocol(websocket))
+    await websocket.send_json({
+        "codec": H264_CODEC,
+        "format": "annexb",
+        "framing": VIDEO_FRAMING,
+        "width": FRAME_WIDTH,
+        "height": FRAME_HEIGHT,
+        "fps": STREAM_FPS
+    })
+
+    # Initialize camera if not already done
+    if segmentation is None:
+        try:
+            load_segmentation(CAMERA_INDEX)
+        except Exception as e:
+            await websocket.send_json({"error": f"Failed to initialize camera: {str(e)}"})
+            manager.disconnect(websocket)
+            return
+
+    ensure_stream_running()
+
+    try:
+        # Chunks are pushed by the shared loop; here we only handle acks
+        while True:
+            message = await websocket.receive()
+            acked = time.time()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                message = json.loads(message.get("text") or "")
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                await handle_ack(websocket, message, acked)
+    except Exception:
+        pass
     finally:
-        # Release camera
-        cap.release()
+        # Client disconnected
+        manager.disconnect(websocket)
 
 if __name__ == "__main__":
     # Run the FastAPI app with uvicorn
-    uvicorn.run("camera_stream:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run("camera_stream:app", host="0.0.0.0", port=8000, reload=True)
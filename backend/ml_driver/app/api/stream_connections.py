@@ -0,0 +1,243 @@
+import asyncio
+import json
+import struct
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+# How long broadcast errors and closes may wait on a single socket
+CONTROL_SEND_TIMEOUT = 1.0
+
+# Each video message is a 4-byte big-endian header length, a UTF-8 JSON
+# header (frame_id, keyframe, timestamps), then the frame's Annex B chunk
+VIDEO_FRAMING = "u32be-json-header"
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def pack_video_message(header: Dict[str, Any], chunk: bytes) -> bytes:
+    """Prefix an Annex B chunk with its length-delimited JSON header"""
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    return _HEADER_LENGTH.pack(len(encoded)) + encoded + chunk
+
+
+def unpack_video_message(data: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """Split a video message into its header and Annex B chunk"""
+    (length,) = _HEADER_LENGTH.unpack_from(data)
+    start = _HEADER_LENGTH.size
+    return json.loads(data[start:start + length]), data[start + length:]
+
+
+class Subscriber:
+    """
+    One stream client with its own sender task and a one-slot mailbox.
+
+    The capture loop only ever replaces the mailbox contents, so a client
+    that cannot keep up silently drops frames instead of holding back the
+    loop (and with it every other client).
+    """
+    def __init__(self, websocket: WebSocket, rendition: Optional[str] = None,
+                 client_id: Optional[str] = None, priority: Optional[str] = None,
+                 video: bool = False):
+        self.websocket = websocket
+        self.rendition = rendition
+        self.client_id = client_id
+        self.priority = priority
+        self.video = video
+        # Video clients can only start decoding at a keyframe
+        self.waiting_for_keyframe = video
+        # Set once the first keyframe is offered; until then the client is joining
+        self.started = False
+        self.latest = None
+        self.dropped = 0
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, message):
+        """Put a message in the mailbox, replacing any unsent one"""
+        if self.latest is not None:
+            self.dropped += 1
+        self.latest = message
+        self.ready.set()
+
+    def take(self):
+        message, self.latest = self.latest, None
+        self.ready.clear()
+        return message
+
+
+class ConnectionManager:
+    """
+    Tracks stream subscribers and fans frames out to their mailboxes.
+
+    Args:
+        latency: LatencyTracker notified of each frame's per-client send time
+        admission: AdmissionController whose slot each subscriber holds
+    """
+    def __init__(self, latency, admission):
+        self.latency = latency
+        self.admission = admission
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.producer: Optional[asyncio.Task] = None
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return [ws for ws, sub in self.subscribers.items() if not sub.video]
+
+    @property
+    def video_connections(self) -> List[WebSocket]:
+        return [ws for ws, sub in self.subscribers.items() if sub.video]
+
+    async def connect(self, websocket: WebSocket, rendition: str,
+                      client_id: Optional[str] = None, priority: Optional[str] = None,
+                      subprotocol: Optional[str] = None):
+        await websocket.accept(subprotocol=subprotocol)
+        client_id = client_id or self._default_client_id(websocket)
+        self._start(Subscriber(websocket, rendition, client_id, priority))
+
+    async def connect_video(self, websocket: WebSocket, client_id: Optional[str] = None,
+                            priority: Optional[str] = None, subprotocol: Optional[str] = None):
+        await websocket.accept(subprotocol=subprotocol)
+        client_id = client_id or self._default_client_id(websocket)
+        self._start(Subscriber(websocket, client_id=client_id, priority=priority, video=True))
+
+    @staticmethod
+    def _default_client_id(websocket: WebSocket) -> str:
+        address = websocket.client
+        return f"{address.host}:{address.port}" if address else f"client-{id(websocket):x}"
+
+    def _start(self, subscriber: Subscriber):
+        self.subscribers[subscriber.websocket] = subscriber
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
+
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        if subscriber.priority is not None:
+            self.admission.release(subscriber.priority)
+
+    def client_id(self, websocket: WebSocket) -> Optional[str]:
+        subscriber = self.subscribers.get(websocket)
+        return subscriber.client_id if subscriber else None
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def set_rendition(self, websocket: WebSocket, rendition: str):
+        self.subscribers[websocket].rendition = rendition
+
+    def wanted_renditions(self) -> Set[str]:
+        """Renditions with at least one subscriber"""
+        return {sub.rendition for sub in self.subscribers.values() if not sub.video}
+
+    def video_pending(self) -> Set[Subscriber]:
+        """Video subscribers waiting for a keyframe"""
+        return {sub for sub in self.subscribers.values() if sub.video and sub.waiting_for_keyframe}
+
+    def video_joining(self) -> bool:
+        """
+        Whether a new video subscriber is waiting for its first keyframe.
+
+        Only joins force a keyframe; subscribers resyncing after a drop wait
+        for the next scheduled one, so a slow client can't turn the whole
+        stream into keyframes.
+        """
+        return any(not sub.started for sub in self.video_pending())
+
+    async def _sender(self, subscriber: Subscriber):
+        websocket = subscriber.websocket
+        try:
+            while True:
+                await subscriber.ready.wait()
+                frame_id, payload = subscriber.take()
+
+                # Stamp the send time per client, right before it goes out
+                sent = time.time()
+                if subscriber.video:
+                    header, chunk = payload
+                    header["timestamps"]["send"] = sent
+                    await websocket.send_bytes(pack_video_message(header, chunk))
+                else:
+                    payload["timestamp"] = sent
+                    payload["timestamps"]["send"] = sent
+                    await websocket.send_json(payload)
+                self.latency.record_send(subscriber.client_id, frame_id, sent)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.disconnect(websocket)
+
+    def publish_frames(self, frames: Dict[str, str], frame_id: int, timestamps: Dict[str, float]):
+        """
+        Hand each subscriber the encoded frame for its rendition
+
+        Args:
+            frames: Base64 JPEG per rendition
+            frame_id: Sequence number clients echo back in acks
+            timestamps: Pipeline timestamps (capture, inference, encode);
+                each sender adds its own send time
+        """
+        self.latency.record_frame(frame_id, timestamps)
+        for subscriber in self.subscribers.values():
+            # Subscribers that switched rendition mid-encode pick up the next frame
+            if subscriber.video or subscriber.rendition not in frames:
+                continue
+            subscriber.offer((frame_id, {
+                "frame": frames[subscriber.rendition],
+                "rendition": subscriber.rendition,
+                "frame_id": frame_id,
+                "timestamps": dict(timestamps)
+            }))
+
+    def publish_video(self, chunk: bytes, keyframe: bool, joining: Set[Subscriber],
+                      frame_id: int, timestamps: Dict[str, float]):
+        """
+        Hand an H.264 chunk to every video subscriber that can decode it
+
+        Args:
+            chunk: Annex B bytes for one frame
+            keyframe: Whether the chunk starts with a keyframe
+            joining: Subscribers that were waiting when this frame was encoded
+            frame_id: Sequence number clients echo back in acks
+            timestamps: Pipeline timestamps; each sender adds its own send time
+        """
+        for subscriber in self.subscribers.values():
+            if not subscriber.video:
+                continue
+            if subscriber.waiting_for_keyframe:
+                if not (keyframe and subscriber in joining):
+                    continue
+                subscriber.waiting_for_keyframe = False
+                subscriber.started = True
+            elif subscriber.latest is not None and not keyframe:
+                # Dropping a chunk breaks the reference chain; resync at the
+                # next keyframe instead of sending undecodable frames
+                subscriber.take()
+                subscriber.dropped += 1
+                subscriber.waiting_for_keyframe = True
+                continue
+            header = {"frame_id": frame_id, "keyframe": keyframe, "timestamps": dict(timestamps)}
+            subscriber.offer((frame_id, (header, chunk)))
+
+    async def _send_control(self, websocket: WebSocket, coroutine):
+        try:
+            await asyncio.wait_for(coroutine, CONTROL_SEND_TIMEOUT)
+        except Exception:
+            self.disconnect(websocket)
+
+    async def broadcast_json(self, data: Dict[str, Any]):
+        await asyncio.gather(*(
+            self._send_control(websocket, websocket.send_json(data))
+            for websocket in list(self.subscribers)
+        ))
+
+    async def close_all(self):
+        websockets = list(self.subscribers)
+        for websocket in websockets:
+            self.disconnect(websocket)
+        await asyncio.gather(*(
+            self._send_control(websocket, websocket.close()) for websocket in websockets
+        ))
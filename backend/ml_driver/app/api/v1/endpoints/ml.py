@@ -1,10 +1,35 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
+from app.core.config import settings
 from app.ml.processor import processor
+from app.utils.admission import AdmissionController
 
 router = APIRouter()
 
+# Limits in-flight predictions so overload sheds ops traffic before the crew's
+admission = AdmissionController(
+    "predictions", settings.PREDICTION_PRIORITY_LIMITS, settings.DEFAULT_PRIORITY,
+    settings.PRIORITY_TOKENS
+)
+
+async def prediction_slot(x_priority_token: Optional[str] = Header(None)):
+    """
+    Hold an in-flight prediction slot for the request, or fail fast with 503
+    """
+    priority = admission.resolve(x_priority_token)
+    if not admission.try_acquire(priority):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many predictions in flight",
+            headers={"Retry-After": str(settings.RETRY_AFTER_SECONDS)}
+        )
+    try:
+        yield priority
+    finally:
+        admission.release(priority)
+
 class PredictionInput(BaseModel):
     """Input data model"""
     data: Dict[str, Any]
@@ -27,20 +52,22 @@ class PredictionResponse(BaseModel):
     feature_importance: Optional[List[float]] = None
 
 @router.get("/predict")
-async def get_prediction():
+async def get_prediction(priority: str = Depends(prediction_slot)):
     """
     Get a sample prediction (for testing/documentation purposes)
     """
-    result = processor.predict({"test": "data"})
+    result = await run_in_threadpool(processor.predict, {"test": "data"})
     return PredictionResponse(**result)
 
 @router.post("/predict", response_model=PredictionResponse)
-async def create_prediction(input_data: PredictionInput):
+async def create_prediction(input_data: PredictionInput, priority: str = Depends(prediction_slot)):
     """
     Create a new prediction based on input data.
+
+    Send a configured `X-Priority-Token` to use the slots reserved for the crew.
     """
     try:
-        result = processor.predict(input_data.data)
+        result = await run_in_threadpool(processor.predict, input_data.data)
         return PredictionResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -50,4 +77,11 @@ async def model_health():
     """
     Check ML processor health
     """
-    return processor.health_check() 
\ No newline at end of file
+    return processor.health_check()
+
+@router.get("/admission")
+async def admission_stats():
+    """
+    In-flight prediction counts and shed request counters
+    """
+    return admission.stats() 
\ No newline at end of file
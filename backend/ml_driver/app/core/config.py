@@ -1,9 +1,37 @@
+import json
+import os
 from pydantic import BaseModel
+from typing import Dict
+
+def load_priority_tokens() -> Dict[str, str]:
+    """Parse the PRIORITY_TOKENS environment variable (JSON token -> class)"""
+    value = os.environ.get("PRIORITY_TOKENS", "{}")
+    try:
+        tokens = json.loads(value)
+    except ValueError as e:
+        raise ValueError(f"PRIORITY_TOKENS is not valid JSON: {e}") from None
+    if not isinstance(tokens, dict) or not all(
+        isinstance(k, str) and isinstance(v, str) for k, v in tokens.items()
+    ):
+        raise ValueError('PRIORITY_TOKENS must be a JSON object like {"<token>": "crew"}')
+    return tokens
 
 class Settings(BaseModel):
     API_V1_STR: str = ""  # Remove version prefix
     PROJECT_NAME: str = "SUITS ML Driver"
     
+    # Admission control: per priority class, the total number of slots that
+    # may be in use when a new client of that class is admitted. Lower
+    # classes get lower ceilings so the remaining slots stay free for the crew.
+    DEFAULT_PRIORITY: str = "ops"
+    STREAM_PRIORITY_LIMITS: Dict[str, int] = {"crew": 8, "ops": 6}
+    PREDICTION_PRIORITY_LIMITS: Dict[str, int] = {"crew": 8, "ops": 4}
+    RETRY_AFTER_SECONDS: int = 2  # Sent with shed requests and stream closes
+    # Secret token -> priority class, e.g. {"<hmd secret>": "crew"}, read from
+    # the PRIORITY_TOKENS environment variable as JSON. Clients without a
+    # configured token always get DEFAULT_PRIORITY.
+    PRIORITY_TOKENS: Dict[str, str] = load_priority_tokens()
+
     # Add more settings as needed
     
     class Config:
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compare bandwidth and modeled send cost of the JPEG and H.264 stream modes.
+
+Usage:
+    python benchmark_stream.py path/to/clip.mp4 [--segment] [--link-mbps 10]
+
+"encode+link" is encode time plus the time to push each frame over a link of
+the given bandwidth. It is a model, not end-to-end latency: capture,
+inference, queueing and client decode/display are not included.
+
+To compare measured glass-to-glass latency, run the server and connect one
+client per mode, e.g. /ws/camera-stream?client_id=hmd-jpeg and
+/ws/video-stream?client_id=hmd-h264. Both streams carry frame ids and
+timestamps and accept the same acks, so /api/latency reports the two
+clients side by side.
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from renditions import RENDITIONS, RenditionEncoder
+from video_encoder import H264StreamEncoder
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+STREAM_FPS = 15
+
+
+def load_frames(path, max_frames, segment):
+    """Read, resize and optionally annotate the clip's frames up front"""
+    segmentation = None
+    if segment:
+        from iphone_yolo_segmentation import iPhoneYOLOSegmentation
+        segmentation = iPhoneYOLOSegmentation(camera_index=0)
+
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
+        if segmentation is not None:
+            frame = segmentation.process_frame(frame)
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def summarize(name, sizes, encode_times, link_mbps):
+    sizes = np.array(sizes, dtype=np.float64)
+    encode_ms = np.array(encode_times) * 1000
+    transmit_ms = sizes * 8 / (link_mbps * 1e6) * 1000
+    modeled_ms = encode_ms + transmit_ms
+    print(f"{name:>12}: {sizes.mean() / 1024:8.1f} KB/frame  "
+          f"{sizes.mean() * 8 * STREAM_FPS / 1e6:6.2f} Mbps  "
+          f"encode p50 {np.percentile(encode_ms, 50):5.1f} ms  "
+          f"encode+link p50 {np.percentile(modeled_ms, 50):5.1f} ms  "
+          f"p95 {np.percentile(modeled_ms, 95):5.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="Path to the benchmark clip")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--segment", action="store_true", help="Annotate frames with YOLOv8 first")
+    parser.add_argument("--link-mbps", type=float, default=10.0, help="Link bandwidth for the encode+link model")
+    args = parser.parse_args()
+
+    frames = load_frames(args.clip, args.max_frames, args.segment)
+    if not frames:
+        print(f"Error: Could not read frames from {args.clip}")
+        return
+    print(f"{len(frames)} frames at {FRAME_WIDTH}x{FRAME_HEIGHT}, {STREAM_FPS} FPS, "
+          f"{args.link_mbps} Mbps link\n")
+
+    # JPEG renditions (base64 payload, as sent over the WebSocket)
+    encoder = RenditionEncoder()
+    for name in RENDITIONS:
+        sizes, encode_times = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            encoded = encoder.encode_one(name, frame)
+            encode_times.append(time.perf_counter() - start)
+            sizes.append(len(encoded))
+        summarize(f"jpeg/{name}", sizes, encode_times, args.link_mbps)
+    encoder.shutdown()
+
+    # H.264 (binary Annex B chunks)
+    video_encoder = H264StreamEncoder(FRAME_WIDTH, FRAME_HEIGHT, STREAM_FPS)
+    sizes, encode_times = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        chunk, _ = video_encoder.encode_frame(frame)
+        encode_times.append(time.perf_counter() - start)
+        sizes.append(len(chunk))
+    summarize("h264", sizes, encode_times, args.link_mbps)
+    video_encoder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class FrameBuffers:
+    """
+    One slot of preallocated arrays for a single frame in flight.
+
+    A slot holds the raw capture, the resized frame fed to the model and the
+    annotated output frame, plus a growable mask buffer that the segmentation
+    step copies its masks into instead of allocating a new array every frame.
+    """
+    def __init__(self, width, height, capture_shape=None, channels=3):
+        self.capture = np.empty(capture_shape or (height, width, channels), dtype=np.uint8)
+        self.resized = np.empty((height, width, channels), dtype=np.uint8)
+        self.output = np.empty((height, width, channels), dtype=np.uint8)
+        self._masks = np.empty((0, 0, 0), dtype=np.uint8)
+
+    def masks(self, count, height, width):
+        """
+        Get a uint8 mask buffer of shape (count, height, width)
+
+        The backing array only grows, so after the first few frames the
+        same memory is reused for every frame.
+        """
+        backing = self._masks
+        if backing.shape[0] < count or backing.shape[1:] != (height, width):
+            backing = np.empty((max(count, backing.shape[0]), height, width), dtype=np.uint8)
+            self._masks = backing
+        return backing[:count]
+
+
+class FrameBufferPool:
+    """
+    Fixed set of preallocated FrameBuffers slots.
+
+    The stream loop takes a slot per frame and returns it once the frame has
+    been encoded, so steady-state operation performs no frame-sized
+    allocations. Acquiring never blocks: an empty pool means a slot leaked or
+    more frames are in flight than the pool was sized for, and the caller
+    skips the frame instead of stalling the event loop.
+    """
+    def __init__(self, width, height, size=1, capture_shape=None, channels=3):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.width = width
+        self.height = height
+        self.size = size
+        self._free = deque(
+            FrameBuffers(width, height, capture_shape, channels) for _ in range(size)
+        )
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a free slot
+
+        Returns:
+            FrameBuffers slot, or None if every slot is in use
+        """
+        with self._lock:
+            return self._free.popleft() if self._free else None
+
+    def release(self, buffers):
+        """
+        Return a slot to the pool
+        """
+        with self._lock:
+            self._free.append(buffers)
+
+    @property
+    def free(self):
+        """Number of slots currently available"""
+        with self._lock:
+            return len(self._free)
+
+
+def read_frame(cap, buffers):
+    """
+    Capture a frame into a slot and resize it into the slot's model input
+
+    Args:
+        cap: Opened cv2.VideoCapture (or anything with a compatible read())
+        buffers: FrameBuffers slot to fill
+
+    Returns:
+        The model input frame (buffers.resized, or buffers.capture when no
+        resize is needed), or None on capture failure
+    """
+    ret, frame = cap.read(buffers.capture)
+    if not ret:
+        return None
+
+    # The camera may deliver a different resolution than we preallocated for;
+    # adopt it so the next read lands in place again
+    if frame is not buffers.capture:
+        buffers.capture = frame
+
+    # Already at the target size, so the capture itself is the model input
+    if frame.shape == buffers.resized.shape:
+        return frame
+
+    cv2.resize(frame, (buffers.resized.shape[1], buffers.resized.shape[0]), dst=buffers.resized)
+    return buffers.resized
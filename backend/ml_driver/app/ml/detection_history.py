@@ -0,0 +1,333 @@
+import glob
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# One row per detection, stored column-wise in fixed-size chunks
+DETECTION_DTYPE = np.dtype([
+    ("timestamp", "f8"),
+    ("camera", "i2"),
+    ("class_id", "i2"),
+    ("box", "f4", (4,)),  # x1, y1, x2, y2 in frame pixels
+    ("confidence", "f4"),
+])
+
+CLASS_NAMES_FILE = "class_names.json"
+
+
+def row_to_dict(row, class_names=None):
+    class_id = int(row["class_id"])
+    return {
+        "timestamp": float(row["timestamp"]),
+        "camera": int(row["camera"]),
+        "class_id": class_id,
+        "class_name": class_names.get(class_id) if class_names else None,
+        "box": [float(v) for v in row["box"]],
+        "confidence": float(row["confidence"])
+    }
+
+
+class HistoryChunk:
+    """
+    A sealed, time-ordered block of detections.
+
+    While in memory the chunk keeps a class index (row order sorted by class,
+    stable so each class's rows stay in time order). Once evicted the rows
+    live in a .npy file that is memory-mapped on demand and only the small
+    summary (time span, classes present) stays resident.
+    """
+    def __init__(self, rows, path=None):
+        self.path = path
+        self.start = float(rows["timestamp"][0])
+        self.end = float(rows["timestamp"][-1])
+        self.classes = set(int(c) for c in np.unique(rows["class_id"]))
+        self.size = len(rows)
+        # Set once the chunk is queued for writing; rows stay readable until then
+        self.evicting = False
+        self._rows = None
+        self._order = None
+        self._class_slices = None
+        if path is None:
+            self._index(rows)
+
+    def _index(self, rows):
+        self._rows = rows
+        self._order = np.argsort(rows["class_id"], kind="stable").astype(np.int32)
+        class_ids, starts, counts = np.unique(
+            rows["class_id"][self._order], return_index=True, return_counts=True
+        )
+        self._class_slices = {
+            int(c): (int(s), int(s + n)) for c, s, n in zip(class_ids, starts, counts)
+        }
+
+    @property
+    def in_memory(self):
+        return self._rows is not None
+
+    @property
+    def rows(self):
+        if self._rows is not None:
+            return self._rows
+        return np.load(self.path, mmap_mode="r")
+
+    def save(self, path):
+        """Write the rows to disk; sealed rows never change, so no lock is needed"""
+        np.save(path, self._rows)
+
+    def drop(self, path):
+        """Switch to the saved file, dropping the rows and class index from memory"""
+        self.path = path
+        self._rows = None
+        self._order = None
+        self._class_slices = None
+
+    def overlaps(self, start, end):
+        return self.end >= start and self.start <= end
+
+    def select(self, start, end, class_id=None):
+        """Rows with start <= timestamp <= end, optionally of one class"""
+        if class_id is not None and class_id not in self.classes:
+            return self.rows[:0]
+
+        if class_id is not None and self._class_slices is not None:
+            lo, hi = self._class_slices[class_id]
+            indices = self._order[lo:hi]
+            timestamps = self._rows["timestamp"][indices]
+            first = np.searchsorted(timestamps, start, side="left")
+            last = np.searchsorted(timestamps, end, side="right")
+            return self._rows[indices[first:last]]
+
+        rows = self.rows
+        first = np.searchsorted(rows["timestamp"], start, side="left")
+        last = np.searchsorted(rows["timestamp"], end, side="right")
+        rows = rows[first:last]
+        if class_id is not None:
+            rows = rows[rows["class_id"] == class_id]
+        return rows
+
+
+class DetectionHistory:
+    """
+    Append-only history of detections with per-class and time indexes.
+
+    Detections go into a preallocated active chunk; full chunks are sealed and
+    indexed, and once more than `memory_chunks` sealed chunks are resident the
+    oldest are written to `directory` as .npy files by a background writer
+    (or dropped when no directory is configured). Call close() on shutdown to
+    write out the detections still in memory. Last-seen lookups are answered from a small
+    dictionary updated on append, so they stay O(1) however long the stream
+    has been running.
+    """
+    def __init__(self, directory: Optional[str] = None, chunk_rows: int = 65536,
+                 memory_chunks: int = 8):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.memory_chunks = memory_chunks
+        self.class_names: Dict[int, str] = {}
+
+        self._chunks: List[HistoryChunk] = []
+        self._active = np.empty(chunk_rows, dtype=DETECTION_DTYPE)
+        self._size = 0
+        self._next_chunk = 0
+        self._last_seen: Dict[Tuple[int, int], np.void] = {}
+        self._lock = threading.Lock()
+        # One writer keeps chunk files in order and off the caller's thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load_existing()
+
+    def _load_existing(self):
+        """Index chunk files and class names left by a previous run"""
+        names_path = os.path.join(self.directory, CLASS_NAMES_FILE)
+        if os.path.exists(names_path):
+            with open(names_path) as f:
+                self.class_names = {int(k): v for k, v in json.load(f).items()}
+
+        for path in sorted(glob.glob(os.path.join(self.directory, "chunk_*.npy"))):
+            rows = np.load(path, mmap_mode="r")
+            if len(rows) == 0 or rows.dtype != DETECTION_DTYPE:
+                continue
+            self._chunks.append(HistoryChunk(rows, path))
+            self._update_last_seen(rows)
+            self._next_chunk = max(self._next_chunk, int(os.path.basename(path)[6:-4]) + 1)
+
+    def _update_last_seen(self, rows):
+        # Rows are time-ordered, so the last row per (camera, class) wins
+        keys = rows["camera"].astype(np.int64) << 16 | (rows["class_id"].astype(np.int64) & 0xFFFF)
+        _, last = np.unique(keys[::-1], return_index=True)
+        for index in len(rows) - 1 - last:
+            row = rows[index]
+            self._last_seen[(int(row["camera"]), int(row["class_id"]))] = row.copy()
+
+    def set_class_names(self, names: Dict[int, str]):
+        """Set the model's class names, persisting them so queries work after a restart"""
+        names = {int(k): v for k, v in names.items()}
+        if names == self.class_names:
+            return
+        self.class_names = names
+        if self.directory is not None:
+            with open(os.path.join(self.directory, CLASS_NAMES_FILE), "w") as f:
+                json.dump(names, f)
+
+    def class_id(self, class_name: str) -> Optional[int]:
+        for class_id, name in self.class_names.items():
+            if name == class_name:
+                return class_id
+        return None
+
+    def append(self, timestamp: float, camera: int, detections):
+        """
+        Append one frame's detections
+
+        Args:
+            timestamp: Capture time of the frame
+            camera: Camera index the frame came from
+            detections: (N, 6) array of x1, y1, x2, y2, confidence, class_id
+        """
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        count = len(detections)
+        if count == 0:
+            return
+
+        with self._lock:
+            offset = 0
+            while offset < count:
+                if self._size == self.chunk_rows:
+                    self._seal()
+                n = min(count - offset, self.chunk_rows - self._size)
+                rows = self._active[self._size:self._size + n]
+                part = detections[offset:offset + n]
+                rows["timestamp"] = timestamp
+                rows["camera"] = camera
+                rows["class_id"] = part[:, 5]
+                rows["box"] = part[:, :4]
+                rows["confidence"] = part[:, 4]
+                self._update_last_seen(rows)
+                self._size += n
+                offset += n
+
+    def _seal(self, keep_in_memory=None):
+        """Seal the active chunk and evict resident chunks beyond the limit"""
+        if self._size:
+            self._chunks.append(HistoryChunk(self._active[:self._size]))
+            self._active = np.empty(self.chunk_rows, dtype=DETECTION_DTYPE)
+            self._size = 0
+
+        keep = self.memory_chunks if keep_in_memory is None else keep_in_memory
+        resident = [chunk for chunk in self._chunks if chunk.in_memory and not chunk.evicting]
+        for chunk in resident[:max(0, len(resident) - keep)]:
+            if self.directory is None:
+                self._chunks.remove(chunk)
+                continue
+            chunk.evicting = True
+            path = os.path.join(self.directory, f"chunk_{self._next_chunk:06d}.npy")
+            self._next_chunk += 1
+            self._writer.submit(self._evict, chunk, path)
+
+    def _evict(self, chunk, path):
+        chunk.save(path)
+        with self._lock:
+            chunk.drop(path)
+
+    def close(self):
+        """
+        Write every detection still in memory to disk and wait for the writer.
+        Queries keep working afterwards, but nothing more can be appended.
+        """
+        with self._lock:
+            if self.directory is not None:
+                self._seal(keep_in_memory=0)
+        self._writer.shutdown(wait=True)
+
+    def _select(self, start, end, class_id=None):
+        """Matching rows from every overlapping chunk, oldest first"""
+        parts = [
+            chunk.select(start, end, class_id)
+            for chunk in self._chunks if chunk.overlaps(start, end)
+        ]
+        active = self._active[:self._size]
+        if len(active) and active["timestamp"][-1] >= start and active["timestamp"][0] <= end:
+            first = np.searchsorted(active["timestamp"], start, side="left")
+            last = np.searchsorted(active["timestamp"], end, side="right")
+            active = active[first:last]
+            if class_id is not None:
+                active = active[active["class_id"] == class_id]
+            parts.append(active)
+        return [part for part in parts if len(part)]
+
+    def last_seen(self, class_id: int, camera: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Most recent detection of a class, optionally from one camera"""
+        with self._lock:
+            rows = [
+                row for (cam, cls), row in self._last_seen.items()
+                if cls == class_id and (camera is None or cam == camera)
+            ]
+        if not rows:
+            return None
+        latest = max(rows, key=lambda row: row["timestamp"])
+        return row_to_dict(latest, self.class_names)
+
+    def counts(self, start: float, end: float, bucket: float,
+               class_id: Optional[int] = None, camera: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Number of detections per time bucket between start and end"""
+        edges = np.arange(start, end + bucket, bucket)
+        if len(edges) < 2:
+            edges = np.array([start, end])
+        totals = np.zeros(len(edges) - 1, dtype=np.int64)
+        with self._lock:
+            for rows in self._select(start, end, class_id):
+                if camera is not None:
+                    rows = rows[rows["camera"] == camera]
+                totals += np.histogram(rows["timestamp"], bins=edges)[0]
+        return [
+            {"start": float(edges[i]), "end": float(edges[i + 1]), "count": int(totals[i])}
+            for i in range(len(totals))
+        ]
+
+    def query(self, start: float, end: float, class_id: Optional[int] = None,
+              camera: Optional[int] = None, region: Optional[Tuple[float, float, float, float]] = None,
+              limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Detections in a time range, newest first
+
+        Args:
+            region: Optional (x1, y1, x2, y2); only boxes intersecting it match
+            limit: Maximum number of detections returned
+        """
+        results = []
+        if limit < 1:
+            return results
+        with self._lock:
+            for rows in reversed(self._select(start, end, class_id)):
+                mask = np.ones(len(rows), dtype=bool)
+                if camera is not None:
+                    mask &= rows["camera"] == camera
+                if region is not None:
+                    boxes = rows["box"]
+                    x1, y1, x2, y2 = region
+                    mask &= (boxes[:, 0] <= x2) & (boxes[:, 2] >= x1)
+                    mask &= (boxes[:, 1] <= y2) & (boxes[:, 3] >= y1)
+                matches = rows[mask]
+                for row in matches[::-1][:limit - len(results)]:
+                    results.append(row_to_dict(row, self.class_names))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "detections": self._size + sum(chunk.size for chunk in self._chunks),
+                # Chunks queued for writing count as on disk
+                "chunks_in_memory": sum(1 for chunk in self._chunks if chunk.in_memory and not chunk.evicting),
+                "chunks_on_disk": sum(1 for chunk in self._chunks if not chunk.in_memory or chunk.evicting),
+                "start": self._chunks[0].start if self._chunks else (
+                    float(self._active["timestamp"][0]) if self._size else None
+                )
+            }
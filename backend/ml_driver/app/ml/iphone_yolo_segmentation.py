@@ -59,13 +59,20 @@ class iPhoneYOLOSegmentation:
             print("If this is not your iPhone camera, please specify the correct index")
         else:
             self.camera_index = camera_index
+        
+        # Detections from the most recent frame: (N, 6) array of
+        # x1, y1, x2, y2, confidence, class_id
+        self.last_detections = np.empty((0, 6), dtype=np.float32)
     
-    def process_frame(self, frame):
+    def process_frame(self, frame, buffers=None):
         """
         Process a single frame with YOLOv8-seg
         
         Args:
             frame: Input image frame from iPhone camera
+            buffers: Optional FrameBuffers slot; when given, the annotations are
+                rendered into buffers.output and masks are copied into the
+                slot's mask buffer instead of allocating new arrays
             
         Returns:
             Processed frame with bounding boxes and simplified segmentation
@@ -73,14 +80,26 @@ class iPhoneYOLOSegmentation:
         # Run inference
         results = self.model(frame, device=self.device)
         
-        # Create a copy of the original frame
-        output_frame = frame.copy()
+        # Render onto a copy of the original frame
+        if buffers is None:
+            output_frame = frame.copy()
+        else:
+            output_frame = buffers.output
+            np.copyto(output_frame, frame)
         
         # Process results
+        self.last_detections = np.empty((0, 6), dtype=np.float32)
         if len(results) > 0:
             # Get the first result
             result = results[0]
             
+            # Keep the detections for the detection history; built from the
+            # named columns since boxes.data gains a track id column when tracking
+            boxes = result.boxes
+            self.last_detections = np.column_stack((
+                boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy()
+            )).astype(np.float32, copy=False)
+            
             # Draw bounding boxes
             for i, box in enumerate(result.boxes.data):
                 x1, y1, x2, y2, conf, cls = box
@@ -112,7 +131,12 @@ class iPhoneYOLOSegmentation:
             # Draw simplified segmentation masks (if available)
             if result.masks is not None:
                 # Get masks
-                masks = result.masks.data.cpu().numpy()
+                if buffers is None:
+                    masks = result.masks.data.cpu().numpy()
+                else:
+                    mask_data = result.masks.data
+                    masks = buffers.masks(*mask_data.shape)
+                    torch.from_numpy(masks).copy_(mask_data)
                 
                 # Draw simplified segmentation masks
                 for i, mask in enumerate(masks):
@@ -130,7 +154,7 @@ class iPhoneYOLOSegmentation:
                         )
                         
                         # Create binary mask
-                        binary_mask = mask.astype(np.uint8)
+                        binary_mask = mask if mask.dtype == np.uint8 else mask.astype(np.uint8)
                         
                         # Find contours of the mask
                         contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
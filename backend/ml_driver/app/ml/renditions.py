@@ -0,0 +1,90 @@
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
+
+import cv2
+import numpy as np
+
+
+class Rendition:
+    """
+    A named output format for the camera stream (resolution x JPEG quality)
+    """
+    def __init__(self, name, width, height, quality):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.quality = quality
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "resolution": f"{self.width}x{self.height}",
+            "quality": self.quality
+        }
+
+
+# Available renditions: the HMD wants small, low-latency frames while the
+# ops console wants full resolution at high quality
+RENDITIONS = {
+    "hmd": Rendition("hmd", 320, 240, 60),
+    "default": Rendition("default", 640, 480, 80),
+    "console": Rendition("console", 640, 480, 95),
+}
+DEFAULT_RENDITION = "default"
+
+
+class RenditionEncoder:
+    """
+    Encodes each frame once per requested rendition, off the event loop.
+
+    Renditions are encoded in parallel on a thread pool (cv2 releases the GIL
+    while resizing and encoding). Each rendition owns a preallocated resize
+    buffer, which is safe because a frame's encodes finish before the next
+    frame is submitted.
+    """
+    def __init__(self, renditions: Dict[str, Rendition] = None):
+        self.renditions = renditions if renditions is not None else RENDITIONS
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.renditions)),
+            thread_name_prefix="rendition-encoder"
+        )
+        self._resized = {
+            name: np.empty((r.height, r.width, 3), dtype=np.uint8)
+            for name, r in self.renditions.items()
+        }
+
+    def encode_one(self, name, frame):
+        """
+        Encode a frame as a base64 JPEG for a single rendition
+        """
+        rendition = self.renditions[name]
+        if frame.shape[:2] != (rendition.height, rendition.width):
+            frame = cv2.resize(frame, (rendition.width, rendition.height),
+                               dst=self._resized[name], interpolation=cv2.INTER_AREA)
+
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, rendition.quality])
+        return base64.b64encode(buffer).decode('utf-8')
+
+    async def encode(self, frame, names: Iterable[str]) -> Dict[str, str]:
+        """
+        Encode a frame for every requested rendition in parallel
+
+        Args:
+            frame: Annotated BGR frame
+            names: Rendition names with at least one subscriber
+
+        Returns:
+            Dictionary mapping rendition name to base64 JPEG
+        """
+        loop = asyncio.get_running_loop()
+        names = [name for name in set(names) if name in self.renditions]
+        encoded = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self.encode_one, name, frame)
+            for name in names
+        ))
+        return dict(zip(names, encoded))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
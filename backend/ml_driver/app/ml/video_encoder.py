@@ -0,0 +1,99 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from typing import Tuple
+
+try:
+    import av
+except ImportError:
+    av = None
+
+if av is not None:
+    try:
+        from av.video.frame import PictureType
+        KEYFRAME = PictureType.I
+    except ImportError:
+        # Older PyAV releases take the picture type as a string
+        KEYFRAME = 'I'
+
+# WebCodecs codec string for H.264 Constrained Baseline, level 3.0: the
+# profile, constraint flags and level bytes of the SPS the encoder emits
+H264_CODEC = "avc1.42C01E"
+
+
+def h264_available():
+    """Check whether PyAV (with libx264) is installed"""
+    return av is not None and 'libx264' in av.codecs_available
+
+
+class H264StreamEncoder:
+    """
+    Low-latency H.264 encoder producing raw Annex B NAL chunks.
+
+    Uses Constrained Baseline with x264's zerolatency tune so each input frame
+    yields its packet immediately (no B-frames, no lookahead). SPS/PPS are
+    repeated in-band with every keyframe, so a client can start decoding from
+    any keyframe; call request_keyframe() when a new client joins.
+    """
+    def __init__(self, width, height, fps, bitrate=800_000, gop_seconds=2):
+        if not h264_available():
+            raise RuntimeError("Video streaming requires PyAV with libx264 (pip install av)")
+
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        context = av.CodecContext.create('libx264', 'w')
+        context.width = width
+        context.height = height
+        context.pix_fmt = 'yuv420p'
+        context.time_base = Fraction(1, fps)
+        context.framerate = Fraction(fps, 1)
+        context.bit_rate = bitrate
+        context.gop_size = fps * gop_seconds
+        context.max_b_frames = 0
+        context.options = {
+            'preset': 'ultrafast',
+            'tune': 'zerolatency',
+            'profile': 'baseline',
+            'level': '3.0',
+            'x264-params': 'repeat-headers=1'
+        }
+        self.context = context
+
+        # Frames must be encoded in order, so a single worker thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="h264-encoder")
+        self._pts = 0
+        self._force_keyframe = True
+
+    def request_keyframe(self):
+        """Make the next encoded frame a keyframe"""
+        self._force_keyframe = True
+
+    def encode_frame(self, frame) -> Tuple[bytes, bool]:
+        """
+        Encode one BGR frame
+
+        Returns:
+            Tuple of (Annex B bytes, whether the chunk starts with a keyframe)
+        """
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        video_frame.pts = self._pts
+        self._pts += 1
+
+        if self._force_keyframe:
+            video_frame.pict_type = KEYFRAME
+            self._force_keyframe = False
+
+        packets = self.context.encode(video_frame)
+        data = b''.join(bytes(packet) for packet in packets)
+        keyframe = any(packet.is_keyframe for packet in packets)
+        return data, keyframe
+
+    async def encode(self, frame) -> Tuple[bytes, bool]:
+        """Encode one frame off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.encode_frame, frame)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,78 @@
+import hmac
+import threading
+from typing import Any, Dict, Optional
+
+
+class AdmissionController:
+    """
+    Counts in-flight work of one kind and sheds it by priority class.
+
+    Each priority class has a ceiling on the total number of slots in use at
+    the time it is admitted. Giving lower classes a lower ceiling keeps the
+    remaining slots free for higher ones, e.g. with {"crew": 8, "ops": 6} ops
+    viewers can never take the last two stream slots from the crew HMD.
+
+    Clients cannot pick their own class: they present a priority token, and
+    only tokens configured in `tokens` (token -> class) map to a class.
+    Anything else, including a bare class name, gets the default class.
+    """
+    def __init__(self, name: str, limits: Dict[str, int], default_priority: str,
+                 tokens: Optional[Dict[str, str]] = None):
+        if default_priority not in limits:
+            raise ValueError(f"Default priority {default_priority} has no limit")
+        tokens = dict(tokens or {})
+        for priority in tokens.values():
+            if priority not in limits:
+                raise ValueError(f"Priority token class {priority} has no limit")
+        self.name = name
+        self.limits = dict(limits)
+        self.default_priority = default_priority
+        self.tokens = tokens
+        self.in_use = 0
+        self.admitted = {priority: 0 for priority in limits}
+        self.shed = {priority: 0 for priority in limits}
+        self._active = {priority: 0 for priority in limits}
+        self._lock = threading.Lock()
+
+    def resolve(self, token: Optional[str]) -> str:
+        """Map a client-supplied priority token to its class"""
+        if token is None:
+            return self.default_priority
+        priority = self.default_priority
+        # Compare against every token so the match time doesn't leak which one is close
+        for candidate, candidate_priority in self.tokens.items():
+            if hmac.compare_digest(token.encode(), candidate.encode()):
+                priority = candidate_priority
+        return priority
+
+    def try_acquire(self, priority: str) -> bool:
+        """
+        Take a slot for the given priority class
+
+        Returns:
+            False (and counts the request as shed) when over capacity
+        """
+        with self._lock:
+            if self.in_use >= self.limits[priority]:
+                self.shed[priority] += 1
+                return False
+            self.in_use += 1
+            self._active[priority] += 1
+            self.admitted[priority] += 1
+            return True
+
+    def release(self, priority: str):
+        with self._lock:
+            if self._active[priority] > 0:
+                self._active[priority] -= 1
+                self.in_use -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "limits": dict(self.limits),
+                "active": dict(self._active),
+                "admitted": dict(self.admitted),
+                "shed": dict(self.shed)
+            }
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Pipeline stages stamped on every frame, in order
+STAGES = ("capture", "inference", "encode", "send")
+
+
+def summarize(samples):
+    """
+    Percentile summary of a sequence of latencies in seconds, reported in ms
+    """
+    if not samples:
+        return None
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+        "count": int(values.size)
+    }
+
+
+class ClientLatency:
+    """
+    Rolling latency samples and clock offset estimate for one client.
+
+    The clock offset is estimated NTP-style from each ack: the server's send
+    time (t1), the client's receive time (t2), the client's ack time (t3) and
+    the server's ack arrival time (t4). The estimate from the sample with the
+    smallest round-trip delay in the window is used, since it has the least
+    queueing asymmetry.
+    """
+    def __init__(self, window, max_pending_frames):
+        self.max_pending_frames = max_pending_frames
+        self.sent: "OrderedDict[int, float]" = OrderedDict()  # frame_id -> send time
+        self.glass_to_glass = deque(maxlen=window)
+        self.network = deque(maxlen=window)
+        self.offsets = deque(maxlen=window)  # (delay, offset) pairs
+        self.acks = 0
+
+    def record_send(self, frame_id, sent):
+        self.sent[frame_id] = sent
+        while len(self.sent) > self.max_pending_frames:
+            self.sent.popitem(last=False)
+
+    def clock_offset(self):
+        """Client clock minus server clock in seconds, or None before any ack"""
+        if not self.offsets:
+            return None
+        return min(self.offsets)[1]
+
+    def round_trip(self):
+        if not self.offsets:
+            return None
+        return min(self.offsets)[0]
+
+
+class LatencyTracker:
+    """
+    Aggregates per-frame pipeline timestamps and client acknowledgements into
+    per-client glass-to-glass latency percentiles.
+
+    All timestamps are wall-clock seconds (time.time() on the server, the
+    client's own clock for ack fields). Client stats are keyed by client id
+    and outlive the connection, so they can still be read after a test
+    session ends and carry on when the client reconnects; the least recently
+    active clients are dropped beyond `max_clients`.
+    """
+    def __init__(self, window=300, max_pending_frames=120, max_clients=32):
+        self.window = window
+        self.max_pending_frames = max_pending_frames
+        self.max_clients = max_clients
+        self._frames: "OrderedDict[int, Dict[str, float]]" = OrderedDict()
+        self._clients: "OrderedDict[str, ClientLatency]" = OrderedDict()
+        self._stages = {stage: deque(maxlen=window) for stage in STAGES[1:]}
+        self._lock = threading.Lock()
+
+    def _client(self, client_id: str) -> ClientLatency:
+        client = self._clients.get(client_id)
+        if client is None:
+            client = self._clients[client_id] = ClientLatency(self.window, self.max_pending_frames)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client_id)
+        return client
+
+    def record_frame(self, frame_id: int, timestamps: Dict[str, float]):
+        """
+        Remember a frame's pipeline timestamps so later acks can be matched
+        """
+        with self._lock:
+            self._frames[frame_id] = timestamps
+            while len(self._frames) > self.max_pending_frames:
+                self._frames.popitem(last=False)
+
+            for previous, stage in zip(STAGES, STAGES[1:]):
+                if previous in timestamps and stage in timestamps:
+                    self._stages[stage].append(timestamps[stage] - timestamps[previous])
+
+    def record_send(self, client_id: str, frame_id: int, sent: float):
+        """
+        Record when a frame actually went out to one client
+
+        Each client has its own sender, so a slow client's send time (and
+        the queueing before it) is tracked separately from everyone else's.
+        """
+        with self._lock:
+            self._client(client_id).record_send(frame_id, sent)
+            timestamps = self._frames.get(frame_id)
+            if timestamps is not None and "encode" in timestamps:
+                self._stages["send"].append(sent - timestamps["encode"])
+
+    def record_ack(self, client_id: str, frame_id: int, received: float,
+                   displayed: Optional[float] = None, acked: Optional[float] = None):
+        """
+        Record a client's acknowledgement of a frame
+
+        Args:
+            client_id: Client identifier
+            frame_id: Frame being acknowledged
+            received: Client time the frame arrived
+            displayed: Client time the frame was shown, if reported
+            acked: Server time the ack arrived (defaults to now)
+
+        Returns:
+            False if the frame is unknown (too old or never sent)
+        """
+        acked = time.time() if acked is None else acked
+        with self._lock:
+            timestamps = self._frames.get(frame_id)
+            client = self._clients.get(client_id)
+            sent = client.sent.get(frame_id) if client is not None else None
+            if timestamps is None or sent is None:
+                return False
+
+            self._clients.move_to_end(client_id)
+            client.acks += 1
+
+            # The ack is sent right after the client's last reported event
+            replied = displayed if displayed is not None else received
+            offset = ((received - sent) + (replied - acked)) / 2
+            delay = max(0.0, (acked - sent) - (replied - received))
+            client.offsets.append((delay, offset))
+
+            offset = client.clock_offset()
+            client.network.append(received - offset - sent)
+            client.glass_to_glass.append(replied - offset - timestamps["capture"])
+            return True
+
+    def client_stats(self, client_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            client = self._clients.get(client_id)
+            if client is None:
+                return None
+            offset = client.clock_offset()
+            round_trip = client.round_trip()
+            return {
+                "acks": client.acks,
+                "clock_offset_ms": offset * 1000 if offset is not None else None,
+                "round_trip_ms": round_trip * 1000 if round_trip is not None else None,
+                "glass_to_glass_ms": summarize(client.glass_to_glass),
+                "network_ms": summarize(client.network)
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Server pipeline stage latencies plus per-client end-to-end latency
+        """
+        with self._lock:
+            pipeline = {stage: summarize(samples) for stage, samples in self._stages.items()}
+            client_ids = list(self._clients)
+        return {
+            "pipeline_ms": pipeline,
+            "clients": {client_id: self.client_stats(client_id) for client_id in client_ids}
+        }
@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.api.v1.endpoints import ml
+from app.core.config import load_priority_tokens
+from app.utils.admission import AdmissionController
+
+client = TestClient(app)
+
+PREDICT_INPUT = {"data": {"feature1": 0.5}}
+CREW_TOKEN = "hmd-secret"
+CREW = {"X-Priority-Token": CREW_TOKEN}
+
+
+def test_lower_priority_cannot_take_reserved_slots():
+    admission = AdmissionController("test", {"crew": 3, "ops": 2}, "ops")
+
+    assert admission.try_acquire("ops")
+    assert admission.try_acquire("ops")
+    assert not admission.try_acquire("ops")
+    assert admission.try_acquire("crew")
+    assert not admission.try_acquire("crew")
+
+    admission.release("ops")
+    assert admission.try_acquire("crew")
+
+    stats = admission.stats()
+    assert stats["in_use"] == 3
+    assert stats["shed"] == {"crew": 1, "ops": 1}
+
+
+def test_priority_comes_from_configured_tokens():
+    admission = AdmissionController("test", {"crew": 3, "ops": 2}, "ops", {CREW_TOKEN: "crew"})
+
+    assert admission.resolve(CREW_TOKEN) == "crew"
+    # A client naming a class itself gets the default
+    assert admission.resolve("crew") == "ops"
+    assert admission.resolve(None) == "ops"
+
+
+def test_predict_sheds_with_retry_after(monkeypatch):
+    monkeypatch.setattr(ml, "admission", AdmissionController(
+        "predictions", {"crew": 2, "ops": 1}, "ops", {CREW_TOKEN: "crew"}
+    ))
+    ml.admission.try_acquire("ops")
+
+    response = client.post("/ml/predict", json=PREDICT_INPUT)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+    response = client.post("/ml/predict", json=PREDICT_INPUT, headers={"X-Priority-Token": "crew"})
+    assert response.status_code == 503
+
+    response = client.post("/ml/predict", json=PREDICT_INPUT, headers=CREW)
+    assert response.status_code == 200
+
+    stats = client.get("/ml/admission").json()
+    assert stats["shed"]["ops"] == 2
+    assert stats["in_use"] == 1
+
+
+def test_crew_latency_under_overload(monkeypatch):
+    monkeypatch.setattr(ml, "admission", AdmissionController(
+        "predictions", {"crew": 4, "ops": 2}, "ops", {CREW_TOKEN: "crew"}
+    ))
+    slow_predict = ml.processor.predict
+
+    def predict(input_data):
+        time.sleep(0.2)
+        return slow_predict(input_data)
+
+    monkeypatch.setattr(ml.processor, "predict", predict)
+
+    def post(headers):
+        start = time.perf_counter()
+        response = client.post("/ml/predict", json=PREDICT_INPUT, headers=headers)
+        return response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        ops = [executor.submit(post, {}) for _ in range(10)]
+        time.sleep(0.05)
+        crew = [executor.submit(post, CREW) for _ in range(2)]
+        ops_results = [f.result() for f in ops]
+        crew_results = [f.result() for f in crew]
+
+    assert any(status == 503 for status, _ in ops_results)
+    assert all(status == 200 for status, _ in crew_results)
+    assert all(elapsed < 1.0 for _, elapsed in crew_results)
+
+
+def test_priority_tokens_env_errors_name_the_setting(monkeypatch):
+    monkeypatch.setenv("PRIORITY_TOKENS", '{"hmd-secret": "crew"')
+    with pytest.raises(ValueError, match="PRIORITY_TOKENS"):
+        load_priority_tokens()
+
+    monkeypatch.setenv("PRIORITY_TOKENS", '["hmd-secret"]')
+    with pytest.raises(ValueError, match="PRIORITY_TOKENS"):
+        load_priority_tokens()
+
+    monkeypatch.setenv("PRIORITY_TOKENS", '{"hmd-secret": "crew"}')
+    assert load_priority_tokens() == {"hmd-secret": "crew"}
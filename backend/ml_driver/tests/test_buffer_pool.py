@@ -0,0 +1,176 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from app.ml.buffer_pool import FrameBufferPool, read_frame
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+CAPTURE_SHAPE = (720, 1280, 3)
+
+# A single 640x480 BGR frame is ~900KB; steady state must stay far below that
+MAX_BYTES_PER_FRAME = 16 * 1024
+# Rendering allocates labels and contours, but nothing frame-sized
+MAX_RENDER_BYTES_PER_FRAME = 64 * 1024
+
+
+class FakeCapture:
+    """Mimics cv2.VideoCapture.read(image), filling the given array in place"""
+    def __init__(self, shape):
+        self.source = np.random.randint(0, 255, shape, dtype=np.uint8)
+
+    def read(self, image=None):
+        if image is None or image.shape != self.source.shape:
+            return True, self.source.copy()
+        np.copyto(image, self.source)
+        return True, image
+
+
+def run_frame(cap, pool):
+    buffers = pool.acquire()
+    try:
+        frame = read_frame(cap, buffers)
+        np.copyto(buffers.output, frame)
+        buffers.masks(4, FRAME_HEIGHT, FRAME_WIDTH)[:] = 1
+    finally:
+        pool.release(buffers)
+
+
+def test_pool_acquire_release():
+    pool = FrameBufferPool(FRAME_WIDTH, FRAME_HEIGHT, size=2)
+
+    first = pool.acquire()
+    second = pool.acquire()
+
+    assert first is not second
+    assert pool.free == 0
+    # An exhausted pool returns immediately instead of blocking
+    assert pool.acquire() is None
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_read_frame_resizes_into_slot():
+    pool = FrameBufferPool(FRAME_WIDTH, FRAME_HEIGHT, capture_shape=CAPTURE_SHAPE)
+    buffers = pool.acquire()
+
+    frame = read_frame(FakeCapture(CAPTURE_SHAPE), buffers)
+
+    assert frame is buffers.resized
+    assert frame.shape == (FRAME_HEIGHT, FRAME_WIDTH, 3)
+
+
+def test_steady_state_allocation_per_frame():
+    cap = FakeCapture(CAPTURE_SHAPE)
+    pool = FrameBufferPool(FRAME_WIDTH, FRAME_HEIGHT, capture_shape=CAPTURE_SHAPE)
+
+    # Warm up so lazily grown buffers (masks) reach their steady size
+    for _ in range(5):
+        run_frame(cap, pool)
+
+    frames = 30
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(frames):
+            run_frame(cap, pool)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak - baseline < MAX_BYTES_PER_FRAME
+    assert (current - baseline) / frames < MAX_BYTES_PER_FRAME
+
+
+class StubBoxes:
+    def __init__(self, data):
+        self.data = data
+        self.xyxy = data[:, :4]
+        self.conf = data[:, 4]
+        self.cls = data[:, 5]
+        self.id = None
+
+
+class StubModel:
+    """Returns the same YOLO-shaped result (boxes and masks) for every frame"""
+    def __init__(self, torch):
+        boxes = torch.tensor([
+            [40, 60, 200, 300, 0.9, 0],
+            [300, 200, 420, 330, 0.8, 24],
+        ], dtype=torch.float32)
+        masks = torch.zeros((2, FRAME_HEIGHT, FRAME_WIDTH), dtype=torch.float32)
+        masks[0, 60:300, 40:200] = 1
+        masks[1, 200:330, 300:420] = 1
+
+        result = type("Result", (), {})()
+        result.boxes = StubBoxes(boxes)
+        result.masks = type("Masks", (), {"data": masks})()
+        result.names = {0: "person", 24: "backpack"}
+        self.results = [result]
+
+    def __call__(self, frame, device=None):
+        return self.results
+
+
+def make_segmentation():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("ultralytics")
+    from app.ml.iphone_yolo_segmentation import iPhoneYOLOSegmentation
+
+    # Skip __init__ so no weights are loaded
+    segmentation = iPhoneYOLOSegmentation.__new__(iPhoneYOLOSegmentation)
+    segmentation.model = StubModel(torch)
+    segmentation.device = "cpu"
+    return segmentation
+
+
+def run_pipeline_frame(cap, pool, segmentation):
+    buffers = pool.acquire()
+    try:
+        frame = read_frame(cap, buffers)
+        return segmentation.process_frame(frame, buffers=buffers), buffers
+    finally:
+        pool.release(buffers)
+
+
+def test_process_frame_renders_into_slot():
+    segmentation = make_segmentation()
+    pool = FrameBufferPool(FRAME_WIDTH, FRAME_HEIGHT, capture_shape=CAPTURE_SHAPE)
+
+    output, buffers = run_pipeline_frame(FakeCapture(CAPTURE_SHAPE), pool, segmentation)
+
+    assert output is buffers.output
+    assert not np.array_equal(output, buffers.resized)
+    # Masks were copied into the slot's reusable buffer
+    masks = buffers.masks(2, FRAME_HEIGHT, FRAME_WIDTH)
+    assert masks.dtype == np.uint8
+    assert masks[1, 250, 350] == 1 and masks[1, 10, 10] == 0
+    # Detections for the history are x1, y1, x2, y2, confidence, class_id
+    assert segmentation.last_detections.shape == (2, 6)
+    assert segmentation.last_detections[1, 5] == 24
+
+
+def test_process_frame_steady_state_allocation():
+    segmentation = make_segmentation()
+    cap = FakeCapture(CAPTURE_SHAPE)
+    pool = FrameBufferPool(FRAME_WIDTH, FRAME_HEIGHT, capture_shape=CAPTURE_SHAPE)
+
+    for _ in range(5):
+        run_pipeline_frame(cap, pool, segmentation)
+
+    frames = 30
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(frames):
+            run_pipeline_frame(cap, pool, segmentation)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak - baseline < MAX_RENDER_BYTES_PER_FRAME
+    assert (current - baseline) / frames < MAX_RENDER_BYTES_PER_FRAME
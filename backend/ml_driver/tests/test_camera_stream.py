@@ -0,0 +1,123 @@
+import asyncio
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+from app.api import camera_stream
+from app.ml.detection_history import DetectionHistory
+
+
+class FakeWebSocket:
+    def __init__(self, headers=None, subprotocols=()):
+        self.client = None
+        self.headers = headers or {}
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.subprotocol = None
+        self.sent = []
+        self.closed = False
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=None):
+        self.closed = True
+
+
+class FakeCapture:
+    def __init__(self, index):
+        self.frame = np.zeros((camera_stream.FRAME_HEIGHT, camera_stream.FRAME_WIDTH, 3), dtype=np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def read(self, image=None):
+        return True, self.frame.copy()
+
+    def release(self):
+        pass
+
+
+class FailingSegmentation:
+    """Raises on the third frame, like a model hitting a bad input"""
+    camera_index = 0
+
+    def __init__(self):
+        self.frames = 0
+        self.last_detections = np.empty((0, 6), dtype=np.float32)
+
+    def process_frame(self, frame, buffers=None):
+        self.frames += 1
+        if self.frames == 3:
+            raise RuntimeError("inference failed")
+        return frame
+
+
+def test_stream_error_closes_clients_and_frees_slots(monkeypatch):
+    monkeypatch.setattr(camera_stream.cv2, "VideoCapture", FakeCapture)
+    monkeypatch.setattr(camera_stream, "segmentation", FailingSegmentation())
+    monkeypatch.setattr(camera_stream, "history", DetectionHistory())
+    monkeypatch.setattr(camera_stream, "STREAM_FPS", 100)
+
+    async def run():
+        websocket = FakeWebSocket()
+        priority = await camera_stream.admit(websocket)
+        await camera_stream.manager.connect(websocket, camera_stream.DEFAULT_RENDITION, "hmd", priority)
+
+        await asyncio.wait_for(camera_stream.stream_frames(), timeout=5)
+
+        assert {"error": "inference failed"} in websocket.sent
+        assert websocket.closed
+        assert not camera_stream.manager.has_subscribers()
+        assert camera_stream.admission.stats()["in_use"] == 0
+
+    asyncio.run(run())
+
+
+def test_region_query_validates_limit_and_region(monkeypatch):
+    history = DetectionHistory()
+    history.append(1000.0, 0, [[10, 10, 50, 50, 0.9, 0]] * 3)
+    monkeypatch.setattr(camera_stream, "history", history)
+    client = TestClient(camera_stream.app)
+    region = {"x1": 0, "y1": 0, "x2": 100, "y2": 100, "start": 0, "end": 2000}
+
+    response = client.get("/api/detections/region", params={**region, "limit": 2})
+    assert len(response.json()["detections"]) == 2
+
+    assert client.get("/api/detections/region", params={**region, "limit": -2}).status_code == 422
+    assert client.get("/api/detections/region", params={**region, "x1": 200}).status_code == 400
+
+
+def test_malformed_ack_is_rejected_without_disconnecting():
+    async def run():
+        websocket = FakeWebSocket()
+        message = {"ack": [1], "received": 1000.0}
+
+        assert await camera_stream.handle_ack(websocket, message, 1000.1)
+        assert websocket.sent == [{"error": "Invalid ack"}]
+
+    asyncio.run(run())
+
+
+def test_priority_token_comes_from_handshake():
+    native = FakeWebSocket(headers={"x-priority-token": "hmd-secret"})
+    browser = FakeWebSocket(subprotocols=["suits-stream", "priority-token.hmd-secret"])
+
+    assert camera_stream.priority_token(native) == "hmd-secret"
+    assert camera_stream.priority_token(browser) == "hmd-secret"
+    assert camera_stream.priority_token(FakeWebSocket()) is None
+    # Browsers must get one of their offered subprotocols back
+    assert camera_stream.stream_subprotocol(browser) == "suits-stream"
+    assert camera_stream.stream_subprotocol(native) is None
@@ -0,0 +1,72 @@
+import numpy as np
+
+from app.ml.detection_history import DetectionHistory
+
+BACKPACK = 24
+PERSON = 0
+
+
+def detections(*rows):
+    """(class_id, x1, y1, x2, y2) tuples to an (N, 6) detection array"""
+    return np.array([[x1, y1, x2, y2, 0.9, cls] for cls, x1, y1, x2, y2 in rows], dtype=np.float32)
+
+
+def fill(history, frames=100, fps=15.0, start=1000.0):
+    for i in range(frames):
+        rows = [(PERSON, 10, 10, 50, 50)]
+        if i % 10 == 0:
+            rows.append((BACKPACK, 400 + i, 300, 450 + i, 350))
+        history.append(start + i / fps, camera=1, detections=detections(*rows))
+
+
+def test_last_seen_counts_and_region(tmp_path):
+    history = DetectionHistory(str(tmp_path), chunk_rows=16, memory_chunks=2)
+    history.set_class_names({PERSON: "person", BACKPACK: "backpack"})
+    fill(history)
+
+    stats = history.stats()
+    assert stats["detections"] == 110
+    assert stats["chunks_on_disk"] > 0
+    assert stats["chunks_in_memory"] <= 2
+
+    last = history.last_seen(history.class_id("backpack"))
+    assert last["timestamp"] == 1000.0 + 90 / 15.0
+    assert last["class_name"] == "backpack"
+    assert last["box"][0] == 490
+    assert history.last_seen(BACKPACK, camera=2) is None
+
+    buckets = history.counts(1000.0, 1000.0 + 100 / 15.0, bucket=1.0, class_id=BACKPACK)
+    assert sum(b["count"] for b in buckets) == 10
+
+    # Only the backpacks reach into the bottom right of the frame
+    found = history.query(0.0, 2000.0, region=(400, 300, 640, 480), limit=3)
+    assert [d["class_id"] for d in found] == [BACKPACK] * 3
+    assert found[0]["timestamp"] > found[1]["timestamp"] > found[2]["timestamp"]
+    assert history.query(0.0, 2000.0, limit=-2) == []
+    history.close()
+
+
+def test_reload_from_disk(tmp_path):
+    history = DetectionHistory(str(tmp_path), chunk_rows=16, memory_chunks=2)
+    history.set_class_names({PERSON: "person", BACKPACK: "backpack"})
+    fill(history)
+    # Resident chunks and the partly filled active chunk are written on close
+    history.close()
+
+    reloaded = DetectionHistory(str(tmp_path), chunk_rows=16)
+
+    assert reloaded.stats()["detections"] == 110
+    assert reloaded.class_id("backpack") == BACKPACK
+    assert reloaded.last_seen(PERSON)["timestamp"] == 1000.0 + 99 / 15.0
+    assert len(reloaded.query(0.0, 2000.0, class_id=BACKPACK)) == 10
+
+
+def test_memory_only_history_drops_old_chunks():
+    history = DetectionHistory(chunk_rows=16, memory_chunks=1)
+    fill(history)
+
+    stats = history.stats()
+    assert stats["chunks_on_disk"] == 0
+    assert stats["detections"] < 110
+    # Last-seen survives eviction
+    assert history.last_seen(BACKPACK)["timestamp"] == 1000.0 + 90 / 15.0
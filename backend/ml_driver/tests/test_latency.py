@@ -0,0 +1,63 @@
+import pytest
+
+from app.utils.latency import LatencyTracker
+
+# Client clock runs 5 s ahead of the server; one-way network delay is 20 ms
+CLOCK_OFFSET = 5.0
+NETWORK_DELAY = 0.02
+
+
+def send_and_ack(tracker, frame_id, capture, display_delay=0.01):
+    timestamps = {
+        "capture": capture,
+        "inference": capture + 0.03,
+        "encode": capture + 0.04,
+    }
+    sent = capture + 0.05
+    tracker.record_frame(frame_id, timestamps)
+    tracker.record_send("hmd", frame_id, sent)
+
+    received = sent + NETWORK_DELAY + CLOCK_OFFSET
+    displayed = received + display_delay
+    acked = displayed - CLOCK_OFFSET + NETWORK_DELAY
+    return tracker.record_ack("hmd", frame_id, received, displayed, acked)
+
+
+def test_clock_offset_and_glass_to_glass():
+    tracker = LatencyTracker()
+    for frame_id in range(1, 21):
+        assert send_and_ack(tracker, frame_id, capture=1000.0 + frame_id / 15)
+
+    stats = tracker.client_stats("hmd")
+
+    assert stats["acks"] == 20
+    assert stats["clock_offset_ms"] == pytest.approx(CLOCK_OFFSET * 1000, abs=0.1)
+    assert stats["round_trip_ms"] == pytest.approx(2 * NETWORK_DELAY * 1000, abs=0.1)
+    # capture -> send (50 ms) + network (20 ms) + display (10 ms)
+    assert stats["glass_to_glass_ms"]["p50"] == pytest.approx(80, abs=0.1)
+    assert stats["network_ms"]["p50"] == pytest.approx(20, abs=0.1)
+
+
+def test_pipeline_stages_and_unknown_frames():
+    tracker = LatencyTracker(max_pending_frames=2)
+    for frame_id in range(1, 4):
+        send_and_ack(tracker, frame_id, capture=float(frame_id))
+
+    # Frame 1 was evicted from the pending window
+    assert not tracker.record_ack("hmd", 1, 0.0)
+
+    pipeline = tracker.stats()["pipeline_ms"]
+    assert pipeline["inference"]["p50"] == pytest.approx(30, abs=0.1)
+    assert pipeline["send"]["p50"] == pytest.approx(10, abs=0.1)
+
+
+def test_clients_are_kept_by_id_with_lru_bound():
+    tracker = LatencyTracker(max_clients=2)
+    tracker.record_frame(1, {"capture": 0.0, "inference": 0.0, "encode": 0.0})
+    for client_id in ("hmd", "console", "hmd", "laptop"):
+        tracker.record_send(client_id, 1, 0.1)
+
+    # "console" was least recently active when "laptop" arrived
+    assert tracker.client_stats("console") is None
+    assert tracker.client_stats("hmd") is not None
+    assert set(tracker.stats()["clients"]) == {"hmd", "laptop"}
@@ -0,0 +1,44 @@
+import asyncio
+import base64
+
+import cv2
+import numpy as np
+
+from app.ml.renditions import Rendition, RenditionEncoder
+
+RENDITIONS = {
+    "small": Rendition("small", 320, 240, 50),
+    "full": Rendition("full", 640, 480, 90),
+}
+
+
+def decode(frame_base64):
+    buffer = np.frombuffer(base64.b64decode(frame_base64), dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def test_encode_only_requested_renditions():
+    encoder = RenditionEncoder(RENDITIONS)
+    frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    try:
+        frames = asyncio.run(encoder.encode(frame, ["small", "small", "unknown"]))
+    finally:
+        encoder.shutdown()
+
+    assert list(frames) == ["small"]
+    assert decode(frames["small"]).shape == (240, 320, 3)
+
+
+def test_encode_multiple_renditions():
+    encoder = RenditionEncoder(RENDITIONS)
+    frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    try:
+        frames = asyncio.run(encoder.encode(frame, ["small", "full"]))
+    finally:
+        encoder.shutdown()
+
+    assert set(frames) == {"small", "full"}
+    assert decode(frames["full"]).shape == (480, 640, 3)
+    assert len(frames["small"]) < len(frames["full"])
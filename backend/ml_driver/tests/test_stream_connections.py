@@ -0,0 +1,204 @@
+import asyncio
+
+from app.api.stream_connections import ConnectionManager, unpack_video_message
+from app.utils.admission import AdmissionController
+from app.utils.latency import LatencyTracker
+
+
+class FakeWebSocket:
+    """Records sent messages; a stalled socket never finishes a send"""
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.client = None
+        self.sent = []
+        self._stall = asyncio.Event()
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_json(self, data):
+        if self.stalled:
+            await self._stall.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        if self.stalled:
+            await self._stall.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+def make_manager():
+    admission = AdmissionController("streams", {"crew": 4, "ops": 4}, "ops")
+    return ConnectionManager(LatencyTracker(), admission)
+
+
+async def publish(manager, frames=10):
+    for frame_id in range(1, frames + 1):
+        timestamps = {"capture": 0.0, "inference": 0.0, "encode": 0.0}
+        manager.publish_frames({"default": f"frame-{frame_id}"}, frame_id, timestamps)
+        await asyncio.sleep(0.01)
+
+
+def chunks(websocket):
+    """Annex B chunks a video client received, without their headers"""
+    return [unpack_video_message(message)[1] for message in websocket.sent]
+
+
+def publish_video(manager, chunk, keyframe, joining, frame_id=1):
+    manager.publish_video(chunk, keyframe, joining, frame_id, {"capture": 0.0, "encode": 0.0})
+
+
+def test_stalled_subscriber_does_not_block_others():
+    async def run():
+        manager = make_manager()
+        fast, stalled = FakeWebSocket(), FakeWebSocket(stalled=True)
+        await manager.connect(fast, "default", "fast")
+        await manager.connect(stalled, "default", "stalled")
+
+        await asyncio.wait_for(publish(manager), timeout=2)
+
+        assert [m["frame_id"] for m in fast.sent] == list(range(1, 11))
+        assert "send" in fast.sent[0]["timestamps"]
+        assert stalled.sent == []
+        # The stalled client holds at most the newest frame, the rest are dropped
+        subscriber = manager.subscribers[stalled]
+        assert subscriber.latest[0] == 10
+        assert subscriber.dropped == 8
+
+        manager.disconnect(fast)
+        manager.disconnect(stalled)
+        assert not manager.has_subscribers()
+
+    asyncio.run(run())
+
+
+def test_video_subscriber_resyncs_at_keyframe_after_drop():
+    async def run():
+        manager = make_manager()
+        websocket = FakeWebSocket()
+        await manager.connect_video(websocket)
+        subscriber = manager.subscribers[websocket]
+
+        # Nothing is sent before the requested keyframe
+        assert manager.video_joining()
+        publish_video(manager, b"p0", False, manager.video_pending())
+        publish_video(manager, b"k1", True, manager.video_pending())
+        await asyncio.sleep(0)
+        publish_video(manager, b"p2", False, set())
+        await asyncio.sleep(0)
+        assert chunks(websocket) == [b"k1", b"p2"]
+
+        # Two chunks arrive before the sender runs: drop both, wait for a keyframe
+        publish_video(manager, b"p3", False, set())
+        publish_video(manager, b"p4", False, set())
+        assert subscriber.waiting_for_keyframe
+        assert manager.video_pending() == {subscriber}
+        # Resyncing waits for the next scheduled keyframe instead of forcing one
+        assert not manager.video_joining()
+        publish_video(manager, b"k5", True, manager.video_pending())
+        await asyncio.sleep(0)
+        assert chunks(websocket) == [b"k1", b"p2", b"k5"]
+
+        manager.disconnect(websocket)
+
+    asyncio.run(run())
+
+
+def test_latency_stats_outlive_disconnect():
+    async def run():
+        manager = make_manager()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "default", "hmd")
+        await publish(manager, frames=1)
+        manager.disconnect(websocket)
+
+        # A late disconnect must not wipe stats a reconnecting client is reusing
+        assert manager.latency.client_stats("hmd") is not None
+
+    asyncio.run(run())
+
+
+def test_crew_stream_under_ops_overload():
+    async def run():
+        admission = AdmissionController("streams", {"crew": 3, "ops": 2}, "ops", {"hmd-secret": "crew"})
+        manager = ConnectionManager(LatencyTracker(), admission)
+
+        # Ops viewers fill their share; one of them has stopped reading
+        viewers = [FakeWebSocket(stalled=True), FakeWebSocket()]
+        for i, websocket in enumerate(viewers):
+            priority = admission.resolve(None)
+            assert admission.try_acquire(priority)
+            await manager.connect(websocket, "default", f"ops-{i}", priority)
+        # Further ops clients are shed, even when they claim to be crew
+        assert not admission.try_acquire(admission.resolve("crew"))
+
+        hmd = FakeWebSocket()
+        priority = admission.resolve("hmd-secret")
+        assert admission.try_acquire(priority)
+        await manager.connect(hmd, "default", "hmd", priority)
+
+        await asyncio.wait_for(publish(manager), timeout=2)
+
+        assert [m["frame_id"] for m in hmd.sent] == list(range(1, 11))
+        assert admission.stats()["active"] == {"crew": 1, "ops": 2}
+        assert admission.stats()["shed"]["ops"] == 1
+
+        await manager.close_all()
+        assert admission.stats()["in_use"] == 0
+
+    asyncio.run(run())
+
+
+def test_stalled_video_subscriber_does_not_force_keyframes():
+    async def run():
+        manager = make_manager()
+        healthy, stalled = FakeWebSocket(), FakeWebSocket(stalled=True)
+        await manager.connect_video(healthy)
+        await manager.connect_video(stalled)
+
+        # Mirror the capture loop: a 10 frame GOP plus keyframes forced for joins
+        forced = 0
+        for index in range(30):
+            force = manager.video_joining()
+            forced += force
+            keyframe = force or index % 10 == 0
+            publish_video(manager, b"k" if keyframe else b"p", keyframe, manager.video_pending())
+            await asyncio.sleep(0)
+
+        assert forced == 1
+        assert chunks(healthy).count(b"k") == 3
+        assert len(healthy.sent) == 30
+
+        manager.disconnect(healthy)
+        manager.disconnect(stalled)
+
+    asyncio.run(run())
+
+
+def test_video_frames_carry_ids_and_timestamps_for_acks():
+    async def run():
+        manager = make_manager()
+        websocket = FakeWebSocket()
+        await manager.connect_video(websocket, "hmd-h264")
+
+        timestamps = {"capture": 100.0, "inference": 100.03, "encode": 100.04}
+        manager.latency.record_frame(7, timestamps)
+        manager.publish_video(b"k7", True, manager.video_pending(), 7, timestamps)
+        await asyncio.sleep(0)
+
+        header, chunk = unpack_video_message(websocket.sent[0])
+        assert chunk == b"k7"
+        assert header["frame_id"] == 7 and header["keyframe"]
+        sent = header["timestamps"]["send"]
+        assert header["timestamps"]["capture"] == 100.0
+
+        # The client clock matches the server's here; 10 ms on the wire
+        assert manager.latency.record_ack("hmd-h264", 7, sent + 0.01, acked=sent + 0.02)
+        assert manager.latency.client_stats("hmd-h264")["acks"] == 1
+
+        manager.disconnect(websocket)
+
+    asyncio.run(run())
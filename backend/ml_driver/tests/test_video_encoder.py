@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from app.ml.video_encoder import H264_CODEC, H264StreamEncoder, h264_available
+
+pytestmark = pytest.mark.skipif(not h264_available(), reason="PyAV with libx264 is not installed")
+
+# Annex B start code followed by an SPS NAL header
+SPS_PREFIX = bytes.fromhex("0000000167")
+
+
+def make_frame(seed, width=320, height=240):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+
+def test_first_frame_is_keyframe_with_headers():
+    encoder = H264StreamEncoder(320, 240, 15)
+
+    chunk, keyframe = encoder.encode_frame(make_frame(0))
+    encoder.close()
+
+    assert keyframe
+    assert chunk.startswith(SPS_PREFIX)
+
+
+def test_requested_keyframe_for_joining_client():
+    encoder = H264StreamEncoder(320, 240, 15)
+    frame = make_frame(1)
+
+    encoder.encode_frame(frame)
+    _, keyframe = encoder.encode_frame(frame)
+    assert not keyframe
+
+    encoder.request_keyframe()
+    chunk, keyframe = encoder.encode_frame(frame)
+    encoder.close()
+
+    assert keyframe
+    assert chunk.startswith(SPS_PREFIX)
+
+
+def test_codec_string_matches_stream():
+    encoder = H264StreamEncoder(640, 480, 15)
+
+    chunk, _ = encoder.encode_frame(make_frame(2, 640, 480))
+    encoder.close()
+
+    # profile_idc, constraint flags and level_idc follow the SPS header
+    start = chunk.index(SPS_PREFIX) + len(SPS_PREFIX)
+    assert H264_CODEC == "avc1." + chunk[start:start + 3].hex().upper()